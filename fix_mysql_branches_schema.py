@@ -30,11 +30,7 @@ def fix_branches_schema():
         
         with connection.cursor() as cursor:
             # Check which columns are missing
-            cursor.execute("""
-                SELECT COLUMN_NAME 
-                FROM INFORMATION_SCHEMA.COLUMNS 
-                WHERE TABLE_SCHEMA = %s AND TABLE_NAME = 'branches'
-            """, [config['database']])
+            cursor.execute("SHOW COLUMNS FROM branches")
             
             existing_columns = [row[0] for row in cursor.fetchall()]
             logger.info(f"Existing columns: {existing_columns}")
@@ -88,23 +88,15 @@ class FinalConsolidatedMySQLMigration:
     
     def table_exists(self, table_name):
         """Check if table exists"""
-        query = """
-        SELECT COUNT(*) as count 
-        FROM information_schema.tables 
-        WHERE table_schema = DATABASE() AND table_name = %s
-        """
-        result = self.execute_query(query, [table_name])
-        return result[0]['count'] > 0
+        # Escape '_' so LIKE matches the name literally
+        result = self.execute_query("SHOW TABLES LIKE %s", [table_name.replace('_', '\\_')])
+        return len(result) > 0
     
     def column_exists(self, table_name, column_name):
         """Check if column exists in table"""
-        query = """
-        SELECT COUNT(*) as count 
-        FROM information_schema.columns 
-        WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s
-        """
-        result = self.execute_query(query, [table_name, column_name])
-        return result[0]['count'] > 0
+        query = f"SHOW COLUMNS FROM `{table_name}` LIKE %s"
+        result = self.execute_query(query, [column_name.replace('_', '\\_')])
+        return len(result) > 0
     
     def create_all_tables(self):
         """Create all WMS tables in correct order (dependencies first)"""
@@ -487,8 +479,9 @@ class FinalConsolidatedMySQLMigration:
     
     def create_env_file(self, config):
         """Create comprehensive .env file with logging configuration"""
+        generated_at = datetime.now()
         env_content = f"""# WMS Complete Environment Configuration - FINAL CONSOLIDATED
-# Generated by mysql_migration_consolidated_final.py on {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+# Generated by mysql_migration_consolidated_final.py on {generated_at:%Y-%m-%d %H:%M:%S}
 
 # =================================
 # DATABASE CONFIGURATION
@@ -510,7 +503,7 @@ MYSQL_DATABASE={config['database']}
 # APPLICATION SECURITY
 # =================================
 # Session Secret (CHANGE IN PRODUCTION!)
-SESSION_SECRET=WMS-Secret-Key-{datetime.now().strftime('%Y%m%d')}-Change-In-Production
+SESSION_SECRET=WMS-Secret-Key-{generated_at:%Y%m%d}-Change-In-Production
 
 # Flask Configuration
 FLASK_ENV=development
@@ -14,10 +14,12 @@ This migration ensures MySQL database consistency and adds documentation.
 
 import os
 import sys
+import argparse
 import logging
+import types
 import pymysql
-from pymysql.cursors import DictCursor
-from datetime import datetime
+from pymysql.constants import CLIENT
+from pymysql.cursors import Cursor, DictCursor, SSCursor
 
 # Configure logging
 logging.basicConfig(
@@ -26,22 +28,72 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# MySQL connection settings, read from the environment once (read-only view)
+MYSQL_CONFIG = types.MappingProxyType({
+    'host': os.getenv('MYSQL_HOST', 'localhost'),
+    'port': int(os.getenv('MYSQL_PORT', '3306')),
+    'user': os.getenv('MYSQL_USER', 'root'),
+    'password': os.getenv('MYSQL_PASSWORD', ''),
+    'database': os.getenv('MYSQL_DATABASE', 'wms_db_dev'),
+    'charset': 'utf8mb4',
+    'autocommit': False
+})
+
+# Process exit codes, so orchestration can branch without parsing logs
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_STRUCTURE_INVALID = 2
+EXIT_DATA_INVALID = 3
+
+REQUIRED_TABLES = ['serial_item_transfers', 'serial_item_transfer_items']
+# Rows pulled per fetch when streaming the --report listing
+REPORT_FETCH_SIZE = 500
+
+# Indexes the integrity probe relies on: (table, index name, column)
+REQUIRED_INDEXES = [
+    ('serial_item_transfer_items', 'idx_serial_item_transfer_id', 'serial_item_transfer_id'),
+    ('serial_item_transfers', 'idx_status', 'status'),
+]
+
+# Any index leading with the column serves the lookup, including the one
+# InnoDB adds implicitly for a foreign key
+INDEX_PROBE_QUERY = "SHOW INDEX FROM {table} WHERE Column_name = %s AND Seq_in_index = 1"
+
+# Non-draft transfers that have no line items (listed with --report)
+INVALID_TRANSFERS_QUERY = """
+SELECT st.id, st.transfer_number, st.status
+FROM serial_item_transfers st
+WHERE st.status != 'draft'
+  AND NOT EXISTS (
+      SELECT 1 FROM serial_item_transfer_items sti
+      WHERE sti.serial_item_transfer_id = st.id
+  )
+"""
+
+# Existence-only form of INVALID_TRANSFERS_QUERY; returns a single row
+INVALID_TRANSFERS_EXIST_QUERY = """
+SELECT EXISTS (
+    SELECT 1 FROM serial_item_transfers st
+    WHERE st.status != 'draft'
+      AND NOT EXISTS (
+          SELECT 1 FROM serial_item_transfer_items sti
+          WHERE sti.serial_item_transfer_id = st.id
+      )
+) AS has_invalid
+"""
+
 class SerialTransferValidationUpdate:
-    def __init__(self):
+    def __init__(self, verbose=False):
         self.connection = None
+        # verbose lists every invalid transfer instead of only probing for one
+        self.verbose = verbose
+        # Filled by validate_tables_exist() from its batched probes
+        self.integrity_rows = None
+        self.index_probes = None
         
     def get_mysql_config(self):
-        """Get MySQL configuration from environment or user input"""
-        config = {
-            'host': os.getenv('MYSQL_HOST', 'localhost'),
-            'port': int(os.getenv('MYSQL_PORT', '3306')),
-            'user': os.getenv('MYSQL_USER', 'root'),
-            'password': os.getenv('MYSQL_PASSWORD', ''),
-            'database': os.getenv('MYSQL_DATABASE', 'wms_db_dev'),
-            'charset': 'utf8mb4',
-            'autocommit': False
-        }
-        return config
+        """Get MySQL configuration read from the environment at import time"""
+        return MYSQL_CONFIG
     
     def connect(self, config):
         """Connect to MySQL database"""
@@ -54,54 +106,114 @@ class SerialTransferValidationUpdate:
                 database=config['database'],
                 charset=config['charset'],
                 cursorclass=DictCursor,
-                autocommit=config['autocommit']
+                autocommit=config['autocommit'],
+                client_flag=CLIENT.MULTI_STATEMENTS
             )
-            logger.info(f"✅ Connected to MySQL: {config['database']} at {config['host']}:{config['port']}")
+            logger.info("✅ Connected to MySQL: %s at %s:%s", config['database'], config['host'], config['port'])
             return True
-        except Exception as e:
-            logger.error(f"❌ MySQL connection failed: {e}")
+        except pymysql.MySQLError as e:
+            logger.error("❌ MySQL connection failed: %s", e)
             return False
     
     def execute_query(self, query, params=None):
-        """Execute query with error handling"""
+        """Execute query with error handling
+        
+        Does not commit; run_migration() commits the whole run once.
+        """
         try:
             with self.connection.cursor() as cursor:
                 cursor.execute(query, params)
-                if query.strip().upper().startswith('SELECT'):
+                if query.strip().upper().startswith(('SELECT', 'SHOW')):
                     return cursor.fetchall()
-                else:
-                    self.connection.commit()
-                    return cursor.rowcount
-        except Exception as e:
-            logger.error(f"❌ Query failed: {e}")
-            self.connection.rollback()
+                return cursor.rowcount
+        except pymysql.MySQLError as e:
+            logger.error("❌ Query failed: %s", e)
             raise
     
-    def table_exists(self, table_name):
-        """Check if table exists"""
-        query = """
-        SELECT COUNT(*) as count 
-        FROM information_schema.tables 
-        WHERE table_schema = DATABASE() AND table_name = %s
+    def fetch_structure_and_data(self, probe_indexes=False):
+        """Probe tables, indexes and the invalid transfer flag in one round trip
+        
+        Returns the set of existing required tables, a dict mapping each
+        REQUIRED_INDEXES (table, column) to whether an index already covers
+        it, and the EXISTS probe rows. The last two are None when a missing
+        table made their statements fail. Index probes are only sent with
+        probe_indexes, i.e. when ensure_indexes() will run. In verbose mode
+        the listing is streamed later instead, so the EXISTS probe is left out.
         """
-        result = self.execute_query(query, [table_name])
-        return result[0]['count'] > 0
+        indexes = REQUIRED_INDEXES if probe_indexes else []
+        # SHOW TABLES reads the current schema only, unlike information_schema
+        # which can materialise metadata for every table on the server.
+        # '_' is escaped so LIKE matches the name literally.
+        statements = ["SHOW TABLES LIKE %s"] * len(REQUIRED_TABLES)
+        params = [table.replace('_', '\\_') for table in REQUIRED_TABLES]
+        for table, _, column in indexes:
+            statements.append(INDEX_PROBE_QUERY.format(table=table))
+            params.append(column)
+        if not self.verbose:
+            statements.append(INVALID_TRANSFERS_EXIST_QUERY)
+        
+        results = []
+        with self.connection.cursor(Cursor) as cursor:
+            cursor.execute(";\n".join(statements), params)
+            results.append(cursor.fetchall())
+            try:
+                while cursor.nextset():
+                    results.append(cursor.fetchall())
+            except pymysql.err.ProgrammingError:
+                # Index and data probes fail when one of the tables is missing
+                pass
+        
+        table_results = results[:len(REQUIRED_TABLES)]
+        index_results = results[len(REQUIRED_TABLES):len(REQUIRED_TABLES) + len(indexes)]
+        integrity_results = results[len(REQUIRED_TABLES) + len(indexes):]
+        
+        existing_tables = {table for table, rows in zip(REQUIRED_TABLES, table_results) if rows}
+        index_probes = None
+        if indexes and len(index_results) == len(indexes):
+            index_probes = {
+                (table, column): bool(rows)
+                for (table, _, column), rows in zip(indexes, index_results)
+            }
+        integrity_rows = integrity_results[0] if integrity_results else None
+        return existing_tables, index_probes, integrity_rows
     
-    def validate_tables_exist(self):
-        """Validate that required tables exist"""
-        required_tables = ['serial_item_transfers', 'serial_item_transfer_items']
+    def validate_tables_exist(self, probe_indexes=False):
+        """Validate that required tables exist
         
+        probe_indexes also fetches the index probes ensure_indexes() reuses.
+        """
         logger.info("🔍 Validating required tables exist...")
-        for table in required_tables:
-            if not self.table_exists(table):
-                logger.error(f"❌ Required table '{table}' does not exist")
+        existing_tables, self.index_probes, self.integrity_rows = self.fetch_structure_and_data(probe_indexes)
+        for table in REQUIRED_TABLES:
+            if table not in existing_tables:
+                logger.error("❌ Required table '%s' does not exist", table)
                 logger.error("Please run the main migration first: mysql_migration_consolidated_final.py")
                 return False
             else:
-                logger.info(f"✅ Table '{table}' exists")
+                logger.info("✅ Table '%s' exists", table)
         
         return True
     
+    def ensure_indexes(self):
+        """Create indexes used by the data integrity probe if they are missing"""
+        logger.info("🔍 Checking indexes used by data integrity validation...")
+        
+        for table, index_name, column in REQUIRED_INDEXES:
+            # Reuse the probe from the structure check batch when it ran
+            if self.index_probes is not None:
+                existing = self.index_probes[(table, column)]
+            else:
+                existing = self.execute_query(INDEX_PROBE_QUERY.format(table=table), [column])
+            if existing:
+                logger.info("ℹ️ Index on %s.%s already exists", table, column)
+                continue
+            
+            try:
+                self.execute_query(f"CREATE INDEX {index_name} ON {table} ({column})")
+                logger.info("✅ Added %s index to %s", index_name, table)
+            except pymysql.MySQLError as e:
+                logger.warning("⚠️ Could not add index %s: %s", index_name, e)
+    
     def verify_application_validation(self):
         """Verify that application-level validations are in place"""
         logger.info("🔍 Verifying application-level validation rules...")
@@ -131,8 +243,8 @@ class SerialTransferValidationUpdate:
         
         for rule in validation_rules:
             status = "✅" if rule['implemented'] else "❌"
-            logger.info(f"{status} {rule['description']}")
-            logger.info(f"   Location: {rule['location']}")
+            logger.info("%s %s", status, rule['description'])
+            logger.info("   Location: %s", rule['location'])
         
         return True
     
@@ -157,44 +269,74 @@ class SerialTransferValidationUpdate:
             self.execute_query(comment_query)
             logger.info("✅ Added comment to serial_item_transfer_items table")
             
-        except Exception as e:
-            logger.warning(f"⚠️ Could not add table comments: {e}")
+        except pymysql.MySQLError as e:
+            logger.warning("⚠️ Could not add table comments: %s", e)
+    
+    def report_invalid_transfers(self):
+        """Log every invalid transfer, streaming rows from the server
+        
+        Returns the number of transfers found.
+        """
+        count = 0
+        # Unbuffered cursor keeps memory flat however many rows match
+        with self.connection.cursor(SSCursor) as cursor:
+            cursor.execute(INVALID_TRANSFERS_QUERY)
+            while True:
+                rows = cursor.fetchmany(REPORT_FETCH_SIZE)
+                if not rows:
+                    break
+                for transfer_id, transfer_number, status in rows:
+                    if count == 0:
+                        logger.warning("⚠️ Transfers without line items in non-draft status:")
+                    count += 1
+                    logger.warning("   Transfer %s (ID: %s) - Status: %s", transfer_number, transfer_id, status)
+        
+        if count:
+            logger.warning("⚠️ Found %d transfers without line items in non-draft status", count)
+        return count
     
     def validate_data_integrity(self):
-        """Validate existing data meets new business rules"""
+        """Validate existing data meets new business rules
+        
+        Returns False when invalid transfers exist. Query errors propagate
+        to run_migration().
+        """
         logger.info("🔍 Validating existing data integrity...")
         
-        try:
-            # Check for transfers without line items
-            query = """
-            SELECT st.id, st.transfer_number, st.status, COUNT(sti.id) as item_count
-            FROM serial_item_transfers st
-            LEFT JOIN serial_item_transfer_items sti ON st.id = sti.serial_item_transfer_id
-            GROUP BY st.id
-            HAVING item_count = 0 AND st.status != 'draft'
-            """
-            
-            invalid_transfers = self.execute_query(query)
-            
-            if invalid_transfers:
-                logger.warning(f"⚠️ Found {len(invalid_transfers)} transfers without line items in non-draft status:")
-                for transfer in invalid_transfers:
-                    logger.warning(f"   Transfer {transfer['transfer_number']} (ID: {transfer['id']}) - Status: {transfer['status']}")
-                
-                # Option to fix these
-                logger.info("💡 These transfers should be set back to 'draft' status or have line items added")
-            else:
-                logger.info("✅ No data integrity issues found")
-            
-            return True
-            
-        except Exception as e:
-            logger.error(f"❌ Data validation failed: {e}")
+        # Check for transfers without line items, reusing the probe fetched
+        # alongside the structure check when available
+        if self.verbose:
+            has_invalid = self.report_invalid_transfers() > 0
+        else:
+            rows = self.integrity_rows
+            if rows is None:
+                with self.connection.cursor(Cursor) as cursor:
+                    cursor.execute(INVALID_TRANSFERS_EXIST_QUERY)
+                    rows = cursor.fetchall()
+            has_invalid = bool(rows[0][0])
+            if has_invalid:
+                logger.warning("⚠️ Found transfers without line items in non-draft status (run with --report to list them)")
+        
+        if has_invalid:
+            # Option to fix these
+            logger.info("💡 These transfers should be set back to 'draft' status or have line items added")
             return False
+        
+        logger.info("✅ No data integrity issues found")
+        return True
     
-    def run_migration(self):
-        """Run the validation update migration"""
+    def run_migration(self, mode='apply'):
+        """Run the validation update migration
+        
+        mode is 'check-only' (read-only checks), 'report' (read-only checks
+        listing every invalid transfer) or 'apply' (checks plus indexes,
+        table comments). Returns an EXIT_* code and
+        stops at the first failing step. Invalid transfers only fail the
+        read-only modes; 'apply' reports them as before and still succeeds.
+        """
+        apply_changes = mode == 'apply'
         logger.info("🚀 Starting Serial Transfer Validation Update Migration")
+        logger.info("Mode: %s", mode)
         logger.info("=" * 70)
         
         # Get configuration
@@ -203,48 +345,81 @@ class SerialTransferValidationUpdate:
         # Connect to database
         if not self.connect(config):
             logger.error("❌ Migration failed: Could not connect to database")
-            return False
+            return EXIT_FAILED
         
         try:
             # Validate required tables exist
-            if not self.validate_tables_exist():
-                return False
-            
-            # Verify application validations
-            self.verify_application_validation()
+            if not self.validate_tables_exist(probe_indexes=apply_changes):
+                return EXIT_STRUCTURE_INVALID
             
-            # Add table comments
-            self.add_table_comments()
+            if apply_changes:
+                # Make sure the integrity probe can use index lookups
+                self.ensure_indexes()
+                
+                # Verify application validations
+                self.verify_application_validation()
+                
+                # Add table comments
+                self.add_table_comments()
+                
+                # Single commit for everything written above
+                self.connection.commit()
             
             # Validate data integrity
-            self.validate_data_integrity()
+            data_valid = self.validate_data_integrity()
+            if not data_valid and not apply_changes:
+                return EXIT_DATA_INVALID
             
             logger.info("=" * 70)
-            logger.info("🎉 SERIAL TRANSFER VALIDATION UPDATE COMPLETED!")
-            logger.info("=" * 70)
-            logger.info("✅ Application validation rules verified")
-            logger.info("✅ Table documentation updated")
-            logger.info("✅ Data integrity validated")
-            logger.info("✅ Business rules enforced:")
-            logger.info("   - Documents require line items before posting")
-            logger.info("   - Line items must be validated and QC approved")
-            logger.info("   - SAP posting only for QC approved transfers")
+            if apply_changes:
+                logger.info("🎉 SERIAL TRANSFER VALIDATION UPDATE COMPLETED!")
+                logger.info("=" * 70)
+                logger.info("✅ Application validation rules verified")
+                logger.info("✅ Table documentation updated")
+                if data_valid:
+                    logger.info("✅ Data integrity validated")
+                else:
+                    logger.warning("⚠️ Data integrity issues reported above")
+                logger.info("✅ Business rules enforced:")
+                logger.info("   - Documents require line items before posting")
+                logger.info("   - Line items must be validated and QC approved")
+                logger.info("   - SAP posting only for QC approved transfers")
+            else:
+                logger.info("✅ SERIAL TRANSFER VALIDATION CHECKS PASSED")
             logger.info("=" * 70)
             
-            return True
+            return EXIT_OK
             
-        except Exception as e:
-            logger.error(f"❌ Migration failed: {e}")
+        except pymysql.MySQLError as e:
+            logger.error("❌ Migration failed: %s", e)
             self.connection.rollback()
-            return False
+            return EXIT_FAILED
             
         finally:
             if self.connection:
                 self.connection.close()
                 logger.info("🔐 Database connection closed")
 
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Serial Transfer Validation Update Migration")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--check-only', dest='mode', action='store_const', const='check-only',
+                      help="Run the structure and data checks without writing anything; "
+                           "exits 3 if transfers without line items exist")
+    mode.add_argument('--report', dest='mode', action='store_const', const='report',
+                      help="Like --check-only, but list every transfer without line items")
+    mode.add_argument('--apply', dest='mode', action='store_const', const='apply',
+                      help="Run the checks and apply indexes and table comments (default); "
+                           "invalid transfers are reported but do not fail the run")
+    parser.set_defaults(mode='apply')
+    parser.add_argument('--auto', action='store_true', help="Do not ask for confirmation")
+    return parser.parse_args(argv)
+
 def main():
     """Main entry point"""
+    args = parse_args()
+    
     print("🚀 Serial Transfer Validation Update Migration")
     print("=" * 70)
     print("This migration validates and documents the new business rules:")
@@ -253,24 +428,25 @@ def main():
     print("3. Proper status transitions are enforced")
     print("=" * 70)
     
-    # Confirm before running
-    if len(sys.argv) > 1 and sys.argv[1] == '--auto':
+    # Confirm before running; read-only modes need no confirmation
+    if args.auto or args.mode != 'apply':
         confirm = 'yes'
     else:
         confirm = input("Do you want to run this validation update? (y/N): ")
     
     if confirm.lower() in ['y', 'yes']:
-        migration = SerialTransferValidationUpdate()
-        success = migration.run_migration()
+        migration = SerialTransferValidationUpdate(verbose=args.mode == 'report')
+        exit_code = migration.run_migration(mode=args.mode)
         
-        if success:
+        if exit_code == EXIT_OK:
             print("\n✅ Migration completed successfully!")
-            print("The Serial Item Transfer module now enforces proper validation rules.")
+            if args.mode == 'apply':
+                print("The Serial Item Transfer module now enforces proper validation rules.")
         else:
-            print("\n❌ Migration failed!")
-            sys.exit(1)
+            print(f"\n❌ Migration failed! (exit code {exit_code})")
+            sys.exit(exit_code)
     else:
         print("Migration cancelled.")
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()